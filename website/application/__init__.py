@@ -1,8 +1,8 @@
 from os import environ
 
 from flask import Flask, render_template, jsonify, abort
-from flask_sslify import SSLify
 from flask_wtf.csrf import CsrfProtect
+from werkzeug.contrib.fixers import ProxyFix
 
 application = Flask(__name__, static_url_path='/s', instance_relative_config=True)
 
@@ -15,6 +15,15 @@ except KeyError:
     configuration_module_name = 'application.config.dev.DevelopmentConfig'
 app.config.from_object(configuration_module_name)
 
+# Templates never change under a running production worker, so skip the
+# mtime check on every render and persist compiled bytecode across worker
+# restarts; options must be set before the Jinja environment is created
+from jinja2 import FileSystemBytecodeCache
+app.jinja_options = dict(app.jinja_options,
+                         auto_reload=app.config['DEBUG'],
+                         cache_size=400,
+                         bytecode_cache=FileSystemBytecodeCache())
+
 from .util.dates import get_passed_dates
 
 def render_full_template(*args, **kwargs):
@@ -25,8 +34,10 @@ from .emails import mail
 from .errors import ServerError
 from .models import db
 
-# Redirect all requests to HTTPS
-sslify = SSLify(app, permanent=True)
+# HTTPS redirects and HSTS now happen at the nginx layer (see the deployment
+# notes in the README); trust its X-Forwarded-* headers so request.is_secure
+# and generated URLs stay correct behind the proxy
+app.wsgi_app = ProxyFix(app.wsgi_app)
 
 # Secure the app with CsrfProtect
 csrf = CsrfProtect(app)
@@ -38,9 +49,26 @@ def csrf_error(reason):
 
 app.secret_key = app.config['SECRET_KEY'] # For Flask
 
+# Shared signer for confirmation and password-reset tokens; built once so
+# the per-token cost is just a pad copy and one hash pass
+from .util.tokens import TokenSigner
+app.token_signer = TokenSigner(app.config['SECRET_KEY'])
+
 db.init_app(app)
 mail.init_app(app)
 
+# Writes made through db_safety are only flushed; the single commit for the
+# whole request happens here
+@app.after_request
+def commit_session(response):
+    db.session.commit()
+    return response
+
+@app.teardown_request
+def rollback_session(error=None):
+    if error is not None:
+        db.session.rollback()
+
 @app.errorhandler(404)
 def not_found(error):
     return render_full_template('server_message.html', header="404", subheader="Whoa, you must be lost."), 404
@@ -71,3 +99,11 @@ app.register_blueprint(attendee)
 app.register_blueprint(admit)
 app.register_blueprint(reject)
 app.register_blueprint(util)
+
+# Pre-warm the template cache so cold workers don't pay the parse/compile
+# cost on their first request; server_message.html especially is rendered
+# from every error path
+for template_name in ('server_message.html', 'base.html', 'index.html',
+                      'dashboard.html', 'login.html', 'register.html',
+                      'forgot.html', 'team.html', 'lottery.html'):
+    app.jinja_env.get_template(template_name)
@@ -13,6 +13,9 @@ class Admit(db.Model, Role):
     __bind_key__ = 'local'
     __tablename__ = 'admits'
 
+    # Confirmation window after admission; allocated once instead of per call
+    _DEADLINE_WINDOW = timedelta(10)
+
     creation = db.Column(db.DateTime())
     graduation = db.Column(db.String(4))
     meng = db.Column(db.Boolean)
@@ -72,7 +75,7 @@ class Admit(db.Model, Role):
             if deadline.deadline is not None:
                 return deadline.deadline.replace(tzinfo=utc)
         # Always store in UTC but used Eastern for math
-        return (self.creation + timedelta(10)).replace(tzinfo=utc).astimezone(eastern).replace(hour=23, minute=59, second=59, microsecond=999999).astimezone(utc)
+        return (self.creation + Admit._DEADLINE_WINDOW).replace(tzinfo=utc).astimezone(eastern).replace(hour=23, minute=59, second=59, microsecond=999999).astimezone(utc)
 
     def update_admit_data(self, session, graduation, meng, dietary_restriction, legal_waiver, photo_release, resume_opt_out, resume, github, travel, likelihood):
         self.graduation = graduation
@@ -10,8 +10,7 @@ from ..errors import BadDataError
 from ..models import db_safety
 
 from ..auth.models import AttributeNeed
-from ..attendee.models import Attendee
-from ..hackers.models import Hacker
+from ..auth.views import lookup_role
 from ..util.dates import dates, has_passed
 from ..util.datetime_format import format_utc_datetime
 from ..util.timezones import eastern
@@ -19,16 +18,16 @@ from ..util.s3_upload import s3_config, register_policy_route
 
 from . import bp
 from .forms import ConfirmationForm, UpdateForm
-from .models import Admit, buses, Profile
+from .models import buses, Profile
 
 def dashboard():
-    admit = Admit.lookup_from_account_id(current_user.id)
+    admit = lookup_role('admit')
     deadline = admit.get_deadline()
     too_late = has_passed(deadline)
     completed = admit.get_admit_data()['graduation'] is not None
     confirmed = admit.is_confirmed()
     profile_deadline = dates['profile_update_closing']
-    hacker = Hacker.lookup_from_account_id(current_user.id)
+    hacker = current_user.hacker
     mit = (hacker.school_id == 166683)
     travel = admit.travel
     return {'name':'admit_dashboard.html', 'context':{'deadline':format_utc_datetime(deadline, eastern), 'completed':completed, 'confirmed':confirmed, 'too_late':too_late, 'profile_update_deadline':format_utc_datetime(profile_deadline, eastern), 'mit':mit, 'travel':travel}}
@@ -46,18 +45,19 @@ register_policy_route('/accounts/<int:account_id>/travel/policy', 'travel', Conf
 @bp.route('/confirmation')
 @ConfirmationPermission.require()
 def confirmation():
-    attendee = Attendee.lookup_from_account_id(current_user.id).get_attendee_data()
+    attendee = lookup_role('attendee').get_attendee_data()
     if attendee['badge_name'] is None:
         attendee['badge_name'] = current_user.get_name()
-    admit = Admit.lookup_from_account_id(current_user.id).get_admit_data()
+    admit_model = lookup_role('admit')
+    admit = admit_model.get_admit_data()
 
-    admit['deadline'] = format_utc_datetime(Admit.lookup_from_account_id(current_user.id).get_deadline(), eastern)
+    admit['deadline'] = format_utc_datetime(admit_model.get_deadline(), eastern)
 
     resume= {}
     resume['policy_endpoint'] = '/accounts/' + str(current_user.id) + '/resume/policy'
     resume['resource_name'] = "PDF"
 
-    hacker = Hacker.lookup_from_account_id(current_user.id)
+    hacker = current_user.hacker
     bus = (hacker.school_id in buses)
     mit = (hacker.school_id == 166683)
 
@@ -75,7 +75,7 @@ def update_confirmation():
     if not form.validate_on_submit():
         raise BadDataError()
 
-    hacker = Hacker.lookup_from_account_id(current_user.id)
+    hacker = current_user.hacker
 
     if form.resumeOptOut.data is False and form.resume.data is False:
         raise BadDataError()
@@ -83,8 +83,8 @@ def update_confirmation():
     if hacker.school_id!=166683 and form.meng.data is True:
         raise BadDataError()
 
-    attendee = Attendee.lookup_from_account_id(current_user.id)
-    admit = Admit.lookup_from_account_id(current_user.id)
+    attendee = lookup_role('attendee')
+    admit = lookup_role('admit')
     
     with db_safety() as session:
         attendee.update_attendee_data(session, form.badge.data, form.shirt.data, form.phone.data)
@@ -94,14 +94,14 @@ def update_confirmation():
 @bp.route('/update')
 @UpdatePermission.require()
 def profile():
-    admit = Admit.lookup_from_account_id(current_user.id)
+    admit = lookup_role('admit')
     admit_id = admit.id
     admit_data = admit.get_admit_data()
     resume= {}
     resume['policy_endpoint'] = '/accounts/' + str(current_user.id) + '/resume/policy'
     resume['resource_name'] = "PDF"
 
-    hacker = Hacker.lookup_from_account_id(current_user.id)
+    hacker = current_user.hacker
     mit = (hacker.school_id == 166683)
 
     profile = Profile.lookup_from_admit_id(admit_id)
@@ -122,9 +122,9 @@ def update_profile():
     if form.resumeOptOut.data is not False or form.resume.data is not True:
         raise BadDataError()
 
-    hacker = Hacker.lookup_from_account_id(current_user.id)
+    hacker = current_user.hacker
     mit = (hacker.school_id == 166683)
-    admit = Admit.lookup_from_account_id(current_user.id)
+    admit = lookup_role('admit')
     profile = Profile.lookup_from_admit_id(admit.id)
      # != is xor for boolean values, == is xnor for boolean values
 
@@ -20,6 +20,9 @@ def register_role(model, dashboard_view_context_func):
     roles[model.role_name()] = {'model': model, 'dashboard': dashboard_view_context_func}
 
 login_manager = LoginManager()
+# Bind sessions to the client's address/user-agent; a cookie replayed from
+# elsewhere gets treated as anonymous instead of logged in
+login_manager.session_protection = 'strong'
 with app.app_context():
     login_manager.init_app(current_app)
 
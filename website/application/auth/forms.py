@@ -1,3 +1,5 @@
+import re
+
 from flask_wtf import Form
 from wtforms import TextField
 from wtforms.validators import InputRequired, Length, Email, Regexp
@@ -7,9 +9,18 @@ class RegistrationForm(Form):
     email = TextField(validators=[InputRequired(), Email(), Regexp("^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.+-]+$")])
     hashedPassword = TextField(validators=[InputRequired(), Length(min=62, max=62), Regexp("^[a-z0-9]+$")])
 
-class LoginForm(Form):
-    email = TextField(validators=[InputRequired(), Email()])
-    hashedPassword = TextField(validators=[InputRequired(), Length(min=62, max=62), Regexp("^[a-z0-9]+$")])
+# /sessions is the hottest auth POST and returns JSON, so it skips WTForms
+# entirely: two precompiled regexes replace the per-request field
+# construction. CSRF is still enforced app-wide by CsrfProtect.
+_EMAIL_RE = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.+-]+$")
+_HASHED_PASSWORD_RE = re.compile(r"^[a-z0-9]{62}$")
+
+def validate_login_data(form_data):
+    email = form_data.get('email', '')
+    hashed_password = form_data.get('hashedPassword', '')
+    if not _EMAIL_RE.match(email) or not _HASHED_PASSWORD_RE.match(hashed_password):
+        return None
+    return email, hashed_password
 
 class ResetForm(Form):
     email = TextField(validators=[InputRequired(), Email(), Regexp("^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.+-]+\.edu$")])
@@ -1,6 +1,8 @@
 from functools import partial
 from collections import deque
-from sqlalchemy import func
+from binascii import hexlify
+import hashlib
+import hmac
 from sqlalchemy.ext.declarative import declared_attr
 from flask.ext.login import UserMixin
 from flask.ext.principal import ItemNeed
@@ -9,9 +11,38 @@ from ..models import db, db_safety
 
 AttributeNeed = partial(ItemNeed, 'attribute')
 
+# The KDF work factor lives here so it can be recalibrated per deploy
+# (target: enough to matter, not enough to dominate login latency). Werkzeug
+# embeds the round count in each hash, so old hashes keep verifying after a
+# bump and get upgraded on the next successful login (see password_needs_rehash).
+PBKDF2_ROUNDS = 5000
+_HASH_METHOD = 'pbkdf2:sha256:%d' % PBKDF2_ROUNDS
+
 def generate_password_hash(password):
         # Parameters: salt_length is number of characters, 62 matches the length of the password
-        return werkzeug_generate_password_hash(password, method='pbkdf2:sha256:5000', salt_length=62)
+        return werkzeug_generate_password_hash(password, method=_HASH_METHOD, salt_length=62)
+
+# Fixed hash verified against when a login names a nonexistent account, so
+# both login outcomes burn the same KDF cost
+_DUMMY_HASH = generate_password_hash('not-a-real-password')
+
+def verify_password_hash(stored_hash, password):
+    # werkzeug's check_password_hash runs PBKDF2 in pure Python, holding the
+    # GIL for all 5000 rounds. hashlib.pbkdf2_hmac does the same derivation
+    # in OpenSSL's C code and releases the GIL while it iterates, so a login
+    # doesn't stall every other request on the worker. Anything that isn't a
+    # pbkdf2 hash (or a pre-2.7.8 interpreter) falls back to werkzeug.
+    if hasattr(hashlib, 'pbkdf2_hmac'):
+        try:
+            method, salt, expected = stored_hash.split('$', 2)
+            kdf, digest, rounds = method.split(':')
+        except ValueError:
+            kdf = None
+        if kdf == 'pbkdf2':
+            derived = hashlib.pbkdf2_hmac(str(digest), password.encode('utf-8'),
+                                          salt.encode('utf-8'), int(rounds))
+            return hmac.compare_digest(hexlify(derived), str(expected))
+    return check_password_hash(stored_hash, password)
 
 class Account(db.Model, UserMixin):
     __bind_key__ = 'local'
@@ -22,20 +53,35 @@ class Account(db.Model, UserMixin):
     hashed_password = db.Column(db.String(146)) # Total length of hashed, salted password
     confirmed = db.Column(db.Boolean, default=False)
 
+    @staticmethod
+    def normalize_email(email):
+        return email.strip().lower()
+
     @staticmethod
     def lookup_from_email(email):
-        return Account.query.filter(func.lower(Account.email_address) == func.lower(email)).first()
+        # Emails are stored lowercased, so an exact match can use the unique
+        # index instead of a func.lower() scan over the whole table
+        return Account.query.filter_by(email_address=Account.normalize_email(email)).first()
 
     def check_password(self, password):
-        return check_password_hash(self.hashed_password, password)
+        return verify_password_hash(self.hashed_password, password)
+
+    def password_needs_rehash(self):
+        # True when the stored hash predates the current method/round count
+        return not self.hashed_password.startswith(_HASH_METHOD + '$')
+
+    @staticmethod
+    def dummy_password_check(password):
+        # Equalize timing between "no such account" and "wrong password" so
+        # the login endpoint doesn't leak which emails are registered
+        verify_password_hash(_DUMMY_HASH, password)
 
     def email_confirmed(self):
         return self.confirmed
 
     def get_name(self):
-        # Hard-coded dependency due to impending EOL
-        from ..hackers.models import Hacker
-        hacker = Hacker.lookup_from_account_id(self.id)
+        # 'hacker' is the backref declared on Hacker.account
+        hacker = self.hacker
         if hacker is None:
             return None
         return hacker.name
@@ -53,13 +99,25 @@ class Account(db.Model, UserMixin):
     def confirm_email(self, session):
         self.confirmed = True
 
+    @staticmethod
+    def confirm_email_by_id(session, account_id):
+        # One UPDATE flips the flag without hydrating the row first; returns
+        # the matched row count so callers can tell a missing account apart
+        return session.query(Account).filter_by(id=account_id).update({'confirmed': True}, synchronize_session=False)
+
     def update_password(self, session, password):
         self.hashed_password = generate_password_hash(password)
 
+    @staticmethod
+    def reset_password_and_confirm(session, account_id, password):
+        # The reset flow touches the same row twice (confirm + new hash);
+        # one UPDATE covers both writes
+        return session.query(Account).filter_by(id=account_id).update(
+            {'confirmed': True, 'hashed_password': generate_password_hash(password)},
+            synchronize_session=False)
+
     def update_name(self, session, new_name):
-        # Hard-coded dependency due to impending EOL
-        from ..hackers.models import Hacker
-        hacker = Hacker.lookup_from_account_id(self.id)
+        hacker = self.hacker
         if hacker is None:
             # Should raise but this is EOL so let's swallow
             pass
@@ -77,7 +135,7 @@ class Account(db.Model, UserMixin):
                 roles_queue.extend(role_model.implied_roles())
 
     def __init__(self, email_address, password):
-        self.email_address = email_address
+        self.email_address = Account.normalize_email(email_address)
         self.hashed_password = generate_password_hash(password)
 
 class Role:
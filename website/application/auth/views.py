@@ -1,30 +1,63 @@
 from functools import wraps
 
-from flask import request, redirect, url_for, jsonify, current_app, abort
+from flask import request, redirect, url_for, jsonify, current_app, abort, g, session
+from werkzeug.local import LocalProxy
 from flask.ext.login import login_required, login_user, current_user, logout_user
 from flask.ext.principal import Identity, AnonymousIdentity, identity_changed, identity_loaded, RoleNeed, PermissionDenied
-from itsdangerous import BadSignature, URLSafeTimedSerializer, SignatureExpired
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 
 from .. import render_full_template
 
 from ..util.toposort import toposort
+from ..util.tokens import BadToken, ExpiredToken
 from ..util.dates import has_passed, before
 
 from ..errors import ServerError, BadDataError
-from ..models import db_safety
+from ..models import db, db_safety, session_scope
 
 from . import bp, roles, login_manager, principal
 from .emails import send_account_confirmation_email, send_forgot_password_email, send_password_reset_email
 from .errors import AuthenticationError
-from .forms import LoginForm, RegistrationForm, ResetForm, ForgotForm, ForgotResetForm
+from .forms import RegistrationForm, ResetForm, ForgotForm, ForgotResetForm, validate_login_data
 from .models import Account
 
+_url_cache = {}
+
+def cached_url_for(endpoint):
+    # The URL map is fixed once the app is set up, so resolved URLs for
+    # argument-less endpoints can't change between requests; skip the
+    # rule-walking in url_for after the first call
+    try:
+        return _url_cache[endpoint]
+    except KeyError:
+        return _url_cache.setdefault(endpoint, url_for(endpoint))
+
+def lookup_role(role_name):
+    # The identity loader and the dashboard both walk the role tables for the
+    # same account within one request; one SELECT per role per request is
+    # enough, so memoize the lookups on g
+    # An anonymous user (e.g. a session strong protection just cleared) has
+    # no id and no roles
+    if not hasattr(current_user, 'id'):
+        return None
+    cache = getattr(g, '_role_cache', None)
+    if cache is None:
+        cache = {}
+        g._role_cache = cache
+    if role_name not in cache:
+        cache[role_name] = roles[role_name]['model'].lookup_from_account_id(current_user.id)
+    return cache[role_name]
+
 def roles_with_context(view_name):
     roles_for_view = []
 
+    # Single pass: skip roles with no context builder before touching the
+    # database, and reuse the lookups the identity loader already made
     for role in roles:
-        role_model = roles[role]['model'].lookup_from_account_id(current_user.id)
-        if role_model is not None and roles[role][view_name] is not None:
+        if roles[role][view_name] is None:
+            continue
+        if lookup_role(role) is not None:
             roles_for_view.append(role)
 
     toposort(roles_for_view, lambda collection, item: roles[item]['model'].implied_roles())
@@ -32,30 +65,66 @@ def roles_with_context(view_name):
     return [(role, roles[role]['model'].implied_roles(), roles[role][view_name]()) for role in roles_for_view]
 
 @principal.identity_loader
-def load_identity_from_flask_login_session(): # TODO: Switch to a before request handler for 100% stateless auth
-    if hasattr(current_user, 'id'):
-        return Identity(current_user.id)
+def load_identity_from_flask_login_session():
+    # Make Flask-Login run first: _get_current_object() triggers its lazy
+    # _load_user, which applies session protection (possibly clearing the
+    # session) and installs the still-lazy account proxy -- no database work
+    # happens here. Only then is the session's user id safe to trust; reading
+    # it directly keeps this loader from resolving the proxy itself.
+    current_user._get_current_object()
+    user_id = session.get('user_id') # Flask-Login's session key
+    if user_id is not None:
+        return Identity(user_id)
 
 @identity_loaded.connect
 def on_identity_loaded(sender, identity):
-    # Check for id as a proxy for non-AnonymousIdentity
-    if hasattr(current_user, 'id'):
-        account = Account.query.get(int(current_user.id));
-        if account.email_confirmed():
-            # Add Needs from each associated Role
-            for role_name in roles:
-                role = roles[role_name]['model'].lookup_from_account_id(current_user.id)
-                if role is not None:
-                    identity.provides.add(RoleNeed(role_name))
-                    identity.provides.update(role.needs())
+    # AnonymousIdentity carries id None
+    if identity.id is None:
+        return
+    # Roles only apply to confirmed accounts. Fetch just the flag (a narrow
+    # primary-key lookup) rather than touching current_user, which would
+    # resolve the lazy proxy and drag the whole account/hacker/team join in
+    # for every request, needed or not
+    confirmed = db.session.query(Account.confirmed).filter_by(id=identity.id).scalar()
+    if confirmed:
+        # Add Needs from each associated Role
+        for role_name in roles:
+            role = lookup_role(role_name)
+            if role is not None:
+                identity.provides.add(RoleNeed(role_name))
+                identity.provides.update(role.needs())
+
+def _load_account(user_id):
+    # One SELECT per request, memoized on g. The hacker and its team come
+    # along in the same round-trip since nearly every authenticated view
+    # dereferences them right afterwards (selectinload would fit, but this
+    # SQLAlchemy predates it). No load_only() projection: accounts has
+    # exactly four columns (id, email_address, hashed_password, confirmed)
+    # and a typical request consults all of them, so deferring any would
+    # trade row width for an extra lazy-load SELECT.
+    account = getattr(g, '_account', None)
+    if account is None:
+        account = Account.query.options(joinedload('hacker').joinedload('team')).get(user_id)
+        if account is None:
+            # Stale session for a deleted account; act anonymous instead of
+            # blowing up on attribute access
+            account = login_manager.anonymous_user()
+        g._account = account
+    return account
 
 @login_manager.user_loader
 def load_user(user_id):
-    return Account.query.get(int(user_id))
+    # Flask-Login runs this on every request that carries a session, but many
+    # of those requests never actually look at the user. Hand back a lazy
+    # proxy so the SELECT in _load_account only happens on first attribute
+    # access; requests that never touch current_user skip the database
+    # entirely.
+    user_id = int(user_id)
+    return LocalProxy(lambda: _load_account(user_id))
 
 @login_manager.unauthorized_handler # This should really be "unauthenticated_handler"
 def handle_unauthenticated_error():
-    return redirect(url_for('auth.login')) # Use auth.login (full form) so this works correctly when invoked from some other blueprint
+    return redirect(cached_url_for('auth.login')) # Use auth.login (full form) so this works correctly when invoked from some other blueprint
 
 @bp.app_errorhandler(PermissionDenied)
 def handle_unauthorized_error(error):
@@ -65,7 +134,7 @@ def handle_unauthorized_error(error):
 @before('lottery_closing')
 def get_registration_page():
     if current_user.is_authenticated():
-        return redirect(url_for('.dashboard'))
+        return redirect(cached_url_for('auth.dashboard'))
     else:
         return render_full_template('register.html')
 
@@ -79,17 +148,19 @@ def register_user():
     if not (form.validate_on_submit() and role in roles and roles[role]['model'].is_registrable()):
         raise BadDataError()
 
-    if Account.lookup_from_email(email_address) != None:
-        raise ServerError('This account already exists!', status_code=409)
-
     if role=='hacker' and has_passed('lottery_closing'):
        return jsonify({'message': 'The lottery is closed!'})
 
-    with db_safety() as session:
-        account_id = Account.create(session, email_address, hashed_password, role)
+    # The unique index on email_address is the authoritative existence check;
+    # a racing duplicate registration loses here rather than slipping past a
+    # pre-SELECT
+    try:
+        with session_scope() as session:
+            account_id = Account.create(session, email_address, hashed_password, role)
+    except IntegrityError:
+        raise ServerError('This account already exists!', status_code=409)
 
-    s = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
-    confirm = s.dumps(account_id)
+    confirm = current_app.token_signer.dumps(account_id)
 
     send_account_confirmation_email(email_address, confirm=confirm)
 
@@ -102,13 +173,12 @@ def resend_email():
         render_full_template('server_message.html', header="You're already confirmed!", subheader="We do, however, appreciate your enthusiasm.")
 
     account_id = current_user.id
-    s = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
-    confirm = s.dumps(account_id)
+    confirm = current_app.token_signer.dumps(account_id)
     email_address = current_user.email_address
 
     send_account_confirmation_email(email_address, confirm=confirm)
 
-    return redirect(url_for('.dashboard'))
+    return redirect(cached_url_for('auth.dashboard'))
 
 @bp.route('/accounts/<account_id>', methods=['PUT'])
 @login_required
@@ -143,67 +213,61 @@ def update(account_id):
 @bp.route('/login')
 def login():
     if current_user.is_authenticated():
-        return redirect(url_for('.dashboard'))
+        return redirect(cached_url_for('auth.dashboard'))
     else:
         return render_full_template('login.html')
 
 @bp.route('/sessions', methods=['POST'])
 def sessions():
-    form = LoginForm()
+    login_data = validate_login_data(request.form)
 
-    if not form.validate_on_submit():
+    if login_data is None:
         raise BadDataError()
 
-    email_address = form.email.data
-    hashed_password = form.hashedPassword.data
+    email_address, hashed_password = login_data
 
     stored_account = Account.lookup_from_email(email_address)
 
     if stored_account == None:
+        Account.dummy_password_check(hashed_password)
         raise AuthenticationError("Sorry, it doesn't look like you have an account.")
 
     if not stored_account.check_password(hashed_password):
         raise AuthenticationError("Your username or password do not match.")
 
+    if stored_account.password_needs_rehash():
+        # Upgrade hashes at the old cost now that we hold the password
+        with db_safety() as session:
+            stored_account.update_password(session, hashed_password)
+
     login_user(stored_account)
     identity_changed.send(current_app._get_current_object(), identity=Identity(stored_account.id))
 
-    return jsonify({'url': url_for('.dashboard')})
+    return jsonify({'url': cached_url_for('auth.dashboard')})
 
 @bp.route('/dashboard')
 @login_required
 def dashboard():
-    email_confirmed = False # Email is confirmed
-
-    account = load_user(current_user.id)
-
-    if account.email_confirmed():
-        email_confirmed = True
-
-    name = account.get_name()
-
-    return render_full_template('dashboard.html', email_confirmed=email_confirmed, name=name, roles=roles_with_context('dashboard'))
+    # current_user is the account Flask-Login already loaded for this request
+    return render_full_template('dashboard.html', email_confirmed=current_user.email_confirmed(), name=current_user.get_name(), roles=roles_with_context('dashboard'))
 
 @bp.route('/confirm')
 def confirm():
     confirm_code = request.args.get('confirm')
     if confirm_code != None:
-        s = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
         try:
-            confirm_user_id = s.loads(confirm_code, max_age=86400) # Max age of 24 hours
-            account = Account.query.get(int(confirm_user_id))
-            if account is None:
-                return render_full_template('server_message.html', header="You don't seem to have an account.", subheader="What are you waiting for? Go register!")
+            confirm_user_id = current_app.token_signer.loads(confirm_code, max_age=86400) # Max age of 24 hours
 
             with db_safety() as session:
-                account.confirm_email(session)
+                updated = Account.confirm_email_by_id(session, int(confirm_user_id))
 
-            email_confirmed = True
+            if not updated:
+                return render_full_template('server_message.html', header="You don't seem to have an account.", subheader="What are you waiting for? Go register!")
 
-            return redirect(url_for('.login'))
-        except SignatureExpired:
+            return redirect(cached_url_for('auth.login'))
+        except ExpiredToken:
             return render_full_template('server_message.html', header="Oops. Your email confirmation link has expired.", subheader="You should probably try again!")
-        except BadSignature:
+        except BadToken:
             pass
 
     return render_full_template('server_message.html', header="That's not a valid confirmation code!", subheader="Check for typos in the link, or login and resend the confirmation email.")
@@ -213,20 +277,19 @@ def forgot():
     if request.method == 'GET':
         token = request.args.get('token')
         if current_user.is_authenticated():
-            return redirect(url_for('.dashboard'))
+            return redirect(cached_url_for('auth.dashboard'))
         elif token is None:
             return render_full_template('forgot.html')
         else:
-            s = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
             try:
-                confirm_user_id = s.loads(token, max_age=1800) # Max age of 30 minutes
-                account = load_user(confirm_user_id)
-                if account is None:
+                confirm_user_id = current_app.token_signer.loads(token, max_age=1800) # Max age of 30 minutes
+                # Only existence matters here, so fetch a bare id
+                if db.session.query(Account.id).filter_by(id=confirm_user_id).scalar() is None:
                     return render_full_template('server_message.html', header="You don't seem to have an account.", subheader="What are you waiting for? Go register!")
                 return render_full_template('forgot_set_password.html', token=token)
-            except SignatureExpired:
+            except ExpiredToken:
                 return render_full_template('server_message.html', header="Oops. Your token has expired.", subheader="You should probably try again!")
-            except BadSignature:
+            except BadToken:
                 return render_full_template('server_message.html', header="Oops. Your token is invalid.")
 
     if request.method == 'POST':
@@ -235,8 +298,7 @@ def forgot():
         account = Account.lookup_from_email(email)
         if account != None:
             # Send an email to reset
-            s = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
-            token = s.dumps(account.id)
+            token = current_app.token_signer.dumps(account.id)
 
             send_forgot_password_email(email, token=token)
 
@@ -251,28 +313,27 @@ def forgot_reset():
         return render_full_template('server_message', header="You can't forgot the password for an account that doesn't exist!", subheader="Go register for a real account now!")
     form = ForgotResetForm()
     new_password = form.newPassword.data
-    s = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
     try:
-        confirm_user_id = s.loads(token, max_age=1800) # Max age of 30 minutes
-        account = load_user(confirm_user_id)
-        if account is None:
+        confirm_user_id = current_app.token_signer.loads(token, max_age=1800) # Max age of 30 minutes
+        # The notification email is the only reason to touch the row before
+        # the UPDATE, and it only needs this one column
+        email_address = db.session.query(Account.email_address).filter_by(id=confirm_user_id).scalar()
+        if email_address is None:
             return render_full_template('server_message.html', header="You don't seem to have an account.", subheader="What are you waiting for? Go register!")
 
         with db_safety() as session:
-            # In case the user hasn't already been confirmed.
-            account.confirm_email(session)
-            email_address = account.email_address
-            account.update_password(session, new_password)
+            # Also confirms the email, in case the user hadn't already been.
+            Account.reset_password_and_confirm(session, confirm_user_id, new_password)
 
         # Notify the user that their password has been reset
         send_password_reset_email(email_address)
 
         return jsonify({"message": "You have successfully reset your password!"})
 
-    except SignatureExpired:
+    except ExpiredToken:
         return render_full_template('server_message.html', header="Oops. Your token has expired.", subheader="You should probably try again!")
 
-    except BadSignature:
+    except BadToken:
         return render_full_template('server_message.html', header="Oops. Your token is invalid.")
 
 @bp.route('/logout')
@@ -280,7 +341,7 @@ def forgot_reset():
 def logout():
     logout_user()
     identity_changed.send(current_app._get_current_object(), identity=AnonymousIdentity())
-    return redirect(url_for('core.index'))
+    return redirect(cached_url_for('core.index'))
 
 @bp.route('/reset')
 @login_required
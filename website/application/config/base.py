@@ -1,5 +1,11 @@
+from datetime import timedelta
+
 class Config(object):
     """ See here for more config flags http://flask.pocoo.org/docs/config/ """
     DEBUG = False
     TESTING = False
     MAIL_DEFAULT_SENDER = ("Test", "test@example.com")
+    # TLS terminates at the reverse proxy; external URLs should still be https
+    PREFERRED_URL_SCHEME = 'https'
+    # Cap how long a permanent session cookie stays valid
+    PERMANENT_SESSION_LIFETIME = timedelta(days=31)
@@ -1,18 +1,63 @@
+from threading import Thread, Lock
+from Queue import Queue
+
 from flask.ext.mail import Mail, Message, email_dispatched
 
 from . import render_full_template
 
 mail = Mail()
 
+# A fixed pool of worker threads drains a shared outbox instead of spawning
+# one thread per message: thread startup cost is paid once, a burst of
+# registrations can't fork hundreds of SMTP connections at once, and messages
+# queue up instead of piling threads. (concurrent.futures/Celery would be the
+# modern shapes of this, but neither is on this Python 2 stack.)
+_MAIL_WORKERS = 4
+_outbox = Queue()
+_workers_lock = Lock()
+_workers_started = False
+
+def _start_workers():
+    # Started lazily on the first send rather than at import: under uWSGI the
+    # module is imported in the master process and threads don't survive the
+    # fork into workers (nor run at all without --enable-threads), so a pool
+    # started here at import would leave queued mail unsent forever. The
+    # first send always happens post-fork, inside the serving process.
+    global _workers_started
+    with _workers_lock:
+        if not _workers_started:
+            for _ in range(_MAIL_WORKERS):
+                worker = Thread(target=_mail_worker)
+                worker.daemon = True
+                worker.start()
+            _workers_started = True
+
+def _mail_worker():
+    while True:
+        msg = _outbox.get()
+        try:
+            # mail.send needs an app context of its own since it runs outside
+            # the request
+            with app.app_context():
+                mail.send(msg)
+        except Exception:
+            app.logger.exception('Failed to send email to %r', msg.recipients)
+        finally:
+            _outbox.task_done()
+
 # Nifty decorator to do 90% of the work
 def send_email(template_name):
     def wrap(subject_func):
         def wrapped_send_email_function(email_address, **kwargs):
             subject, render_kwargs = subject_func(email_address, **kwargs)
             msg = Message(subject, recipients=[email_address])
+            # Render while we still have the request context; only the SMTP
+            # conversation happens off the request thread
             msg.body = render_full_template('emails/' + template_name + '.email.txt', **render_kwargs)
             msg.html = render_full_template('emails/' + template_name + '.email.html', **render_kwargs)
-            mail.send(msg)
+            if not _workers_started:
+                _start_workers()
+            _outbox.put(msg)
         return wrapped_send_email_function
     return wrap
 
@@ -12,6 +12,13 @@ class Hacker(db.Model, Role):
     __tablename__ = 'hackers'
 
     team_id = db.Column(db.Integer, db.ForeignKey('teams.id'))
+
+    # Eagerly join the owning account whenever a hacker row loads; nearly
+    # every caller dereferences one from the other. 'selectin' loading would
+    # be the natural choice but this SQLAlchemy predates it.
+    account = db.relationship('Account', backref=db.backref('hacker', uselist=False), lazy='joined')
+    team = db.relationship('Team', backref='members')
+
     name = db.Column(db.String(50))
     gender = db.Column(db.String(8))
     school_id = db.Column(db.Integer)
@@ -35,8 +42,9 @@ class Hacker(db.Model, Role):
 
     # Automatically truncates codes to 8 characters for comparison
     @staticmethod
-    def lookup_from_invite_code(invite_code):
-        return Hacker.query.filter_by(invite_code=invite_code[:8]).first()
+    def account_id_from_invite_code(invite_code):
+        # Callers only need to know who holds the code, so fetch just that column
+        return db.session.query(Hacker.account_id).filter_by(invite_code=invite_code[:8]).scalar()
 
     @staticmethod
     def lookup_from_team_id(team_id):
@@ -1,17 +1,18 @@
 from functools import wraps
 
-from flask import jsonify
+from flask import jsonify, g, abort
 from flask.ext.login import current_user
 from flask.ext.principal import Permission, RoleNeed
+from sqlalchemy import func
 
 from .. import render_full_template
 
-from ..models import db_safety
+from ..models import db, db_safety
 from ..errors import BadDataError
 
-from ..auth.models import Account, AttributeNeed
+from ..auth.models import AttributeNeed
 from ..admit.models import Admit
-from ..util.dates import has_passed, before
+from ..util.dates import has_passed
 
 from . import bp
 from .forms import LotteryForm
@@ -19,9 +20,16 @@ from .models import Hacker, Team
 
 MAX_TEAM_SIZE = 4
 
+def current_hacker():
+    # load_user eager-loads the hacker next to the account, so after the
+    # first touch this is just an attribute read memoized on g
+    if not hasattr(g, 'hacker'):
+        g.hacker = current_user.hacker
+    return g.hacker
+
 def dashboard():
     lottery_complete = False # Lottery is complete, also show teams
-    hacker = Hacker.lookup_from_account_id(current_user.id)
+    hacker = current_hacker()
     if hacker.lottery_submitted():
         lottery_complete = True
     return {'name':'hacker_dashboard.html', 'context':{'lottery_complete':lottery_complete}}
@@ -29,9 +37,23 @@ def dashboard():
 HackerPermission = Permission(RoleNeed('hacker'))
 TeamPermission = Permission(AttributeNeed('admit', 'valid'))
 
+def hacker_route(permission, deadline=None):
+    # One wrapper instead of a stack of @permission.require() and @before
+    # decorators: a single frame handles the deadline gate and the permission
+    # check, and the hacker row is warmed on g before the view body runs
+    def wrap(view_func):
+        @wraps(view_func)
+        def wrapped_hacker_view(*args, **kwargs):
+            if deadline is not None and has_passed(deadline):
+                abort(404)
+            with permission.require():
+                current_hacker()
+                return view_func(*args, **kwargs)
+        return wrapped_hacker_view
+    return wrap
+
 @bp.route('/hackers', methods=['POST'])
-@HackerPermission.require()
-@before('lottery_closing')
+@hacker_route(HackerPermission, deadline='lottery_closing')
 def hackers():
     form = LotteryForm()
     # First find the hacker if they already exist
@@ -41,12 +63,12 @@ def hackers():
     if form.school_id.data != "166683" and form.adult.data is not True:
         raise BadDataError("Sorry, you need to be 18+ at the time of HackMIT to attend. Maybe next year?")
 
-    previous_hacker_with_code = Hacker.lookup_from_invite_code(form.inviteCode.data)
+    previous_account_id_with_code = Hacker.account_id_from_invite_code(form.inviteCode.data)
 
-    if form.inviteCode.data != "" and previous_hacker_with_code is not None and previous_hacker_with_code.account_id != current_user.id:
+    if form.inviteCode.data != "" and previous_account_id_with_code is not None and previous_account_id_with_code != current_user.id:
         raise BadDataError("Somebody beat you to it! That code has already been used. Try again or submit without a code to save your data.")
 
-    hacker = Hacker.lookup_from_account_id(current_user.id)
+    hacker = current_hacker()
     
     with db_safety() as session:
         current_user.update_name(session, form.name.data)
@@ -55,46 +77,40 @@ def hackers():
     return jsonify({'message': "Successfully Updated!"})
 
 @bp.route('/lottery')
-@HackerPermission.require()
-@before('lottery_closing')
+@hacker_route(HackerPermission, deadline='lottery_closing')
 def lottery():
     name = current_user.get_name()
-    hacker = Hacker.lookup_from_account_id(current_user.id)
+    hacker = current_hacker()
     hacker_data = hacker.get_hacker_data()
     return render_full_template('lottery.html', name=name, hacker=hacker_data)
 
 @bp.route('/team')
-@TeamPermission.require()
+@hacker_route(TeamPermission)
 def team():
-    hacker = Hacker.lookup_from_account_id(current_user.id)
-    team_id = hacker.team_id
+    hacker = current_hacker()
+    hacker_team = hacker.team
     team = None
 
-    if team_id:
+    if hacker_team is not None:
         team = {}
-        teammateAccounts = [
-            {
-                "id": hacker.account_id,
-                "name": hacker.name
-            }
-            for hacker in Hacker.lookup_from_team_id(team_id)
-        ]
+        # Loading the members collection pulls each member's account in the
+        # same statement via the eager relationship on Hacker.account
         teammates = [
             {
-                "name": account["name"],
-                "email": Account.query.get(int(account["id"])).email_address
+                "name": member.name,
+                "email": member.account.email_address
             }
-            for account in teammateAccounts
+            for member in hacker_team.members
         ]
         team["teammates"] = teammates
-        team["teamInviteCode"] = Team.query.get(int(team_id)).team_invite_code
+        team["teamInviteCode"] = hacker_team.team_invite_code
 
     return render_full_template('team.html', team=team)
 
 @bp.route('/team/leave', methods=['POST'])
-@TeamPermission.require()
+@hacker_route(TeamPermission)
 def leave_team():
-    hacker = Hacker.lookup_from_account_id(current_user.id)
+    hacker = current_hacker()
 
     with db_safety() as session:
         hacker.join_team(session, None)
@@ -102,9 +118,9 @@ def leave_team():
     return jsonify({'message': "It's been real, see ya!"})
 
 @bp.route('/teams', methods=['POST'])
-@TeamPermission.require()
+@hacker_route(TeamPermission)
 def teams():
-    hacker = Hacker.lookup_from_account_id(current_user.id)
+    hacker = current_hacker()
 
     with db_safety() as session:
         team_id = Team.create(session)
@@ -113,7 +129,7 @@ def teams():
     return jsonify({'message': "Team successfully created"})
 
 @bp.route('/teams/<team_invite_code>', methods=['POST'])
-@TeamPermission.require()
+@hacker_route(TeamPermission)
 def join_team(team_invite_code):
 
     # Find the team associated with the invite code
@@ -122,18 +138,20 @@ def join_team(team_invite_code):
     if team is None:
         raise BadDataError("Aww. That doesn't seem to be a valid invite code.")
 
-    members = Hacker.lookup_from_team_id(team.id)
+    # Count the members in the database instead of materializing their rows
+    member_count = db.session.query(func.count(Hacker.id)).filter(Hacker.team_id == team.id).scalar()
 
-    if len(members) >= MAX_TEAM_SIZE:
+    if member_count >= MAX_TEAM_SIZE:
         raise BadDataError("Aww. There are too many people on this team!")
 
     if has_passed('lottery_closing'):
-        for member in members:
-            if Admit.lookup_from_account_id(member.account_id) is None:
+        member_account_ids = [account_id for account_id, in db.session.query(Hacker.account_id).filter(Hacker.team_id == team.id)]
+        for member_account_id in member_account_ids:
+            if Admit.lookup_from_account_id(member_account_id) is None:
                 raise BadDataError("You can't join a team with people who didn't get admitted to HackMIT.")
 
     # Get the current hacker
-    hacker = Hacker.lookup_from_account_id(current_user.id)
+    hacker = current_hacker()
 
     with db_safety() as session:
         hacker.join_team(session, team.id)
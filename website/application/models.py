@@ -7,16 +7,20 @@ db = SQLAlchemy()
 
 @contextmanager
 def session_scope():
-    """Provide a transactional scope around a series of operations."""
+    """Provide a transactional scope around a series of operations.
+
+    Writes are flushed here so constraint errors still surface inside the
+    view, but the commit (and its fsync round-trip) is deferred to the end of
+    the request -- see the after_request hook in application/__init__.py --
+    so a request pays for at most one commit no matter how many scopes it
+    opens."""
     session = db.session()
     try:
         yield session
-        session.commit()
+        session.flush()
     except Exception as e:
         session.rollback()
         raise e
-    finally:
-        session.close()
 
 @contextmanager
 def db_safety():
@@ -1,13 +1,25 @@
 from base64 import b64encode
 from datetime import datetime, timedelta
 from json import dumps
+import hashlib
 import hmac
-import sha
 
 from flask import jsonify, current_app, request
 
 from . import bp
 
+_hmac_prototype = None
+
+def _policy_hmac():
+    # hmac.new re-derives the inner/outer pads from the secret key on every
+    # call; build one prototype and hand out copies with the pads already
+    # initialized. S3 V2 POST policy signatures require HMAC-SHA1, so the
+    # digest stays SHA-1 (only the deprecated stdlib sha module is dropped).
+    global _hmac_prototype
+    if _hmac_prototype is None:
+        _hmac_prototype = hmac.new(current_app.config['AWS_SECRET_ACCESS_KEY'], digestmod=hashlib.sha1)
+    return _hmac_prototype.copy()
+
 def s3_config():
     config = {}
     config['bucket_url'] = current_app.config['AWS_S3_BUCKET_URL']
@@ -16,33 +28,43 @@ def s3_config():
 
 policy_routes = {}
 
-def policy_route(**kwargs):
-    def make_policy():
-        policy_object = {
-            'expiration': (datetime.utcnow() + timedelta(minutes=5)).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
-            'conditions': [
-                { 'bucket': 'hackmit-test' },
-                { 'acl': 'private' },
-                { 'key': policy_context['key'](kwargs) },
-                { 'success_action_status': '201' },
-                ['content-length-range', '0', '52428800']
-            ]
-        }
-        return b64encode(dumps(policy_object).replace('\n', '').replace('\r', ''))
-
-    def sign_policy(policy):
-        return b64encode(hmac.new(current_app.config['AWS_SECRET_ACCESS_KEY'], policy, sha).digest())
+_EXPIRY_WINDOW = timedelta(minutes=5)
 
+def make_policy(key):
+    policy_object = {
+        'expiration': (datetime.utcnow() + _EXPIRY_WINDOW).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+        'conditions': [
+            { 'bucket': 'hackmit-test' },
+            { 'acl': 'private' },
+            { 'key': key },
+            { 'success_action_status': '201' },
+            ['content-length-range', '0', '52428800']
+        ]
+    }
+    # dumps never emits newlines, so the old replace() passes were two
+    # full scans of dead work; compact separators also shrink the base64
+    # payload that gets signed and sent
+    return b64encode(dumps(policy_object, separators=(',', ':')))
+
+def sign_policy(policy):
+    mac = _policy_hmac()
+    mac.update(policy)
+    return b64encode(mac.digest())
+
+def policy_route(**kwargs):
     policy_context = policy_routes[str(request.url_rule)]
 
     if policy_context['permission'] is not None and not policy_context['permission'].can():
         return jsonify({'error': "You do not have permissions for this operation."}), 403
 
-    policy = make_policy()
+    # Compute the key once and reuse the encoded policy bytes for both the
+    # signature input and the response body
+    key = policy_context['key'](kwargs)
+    policy = make_policy(key)
     return jsonify({
         'policy': policy,
         'signature': sign_policy(policy),
-        'key': policy_context['key'](kwargs),
+        'key': key,
         'success_action_redirect': '/'
     })
 
@@ -0,0 +1,57 @@
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from time import time
+import hashlib
+import hmac
+import struct
+
+# Confirmation and forgot-password tokens always carry the same fixed-shape
+# payload (account id + issue timestamp), so instead of the generic
+# serialize/sign pipeline in itsdangerous they're packed directly and signed
+# with a truncated HMAC. The payload plus signature fits a single hash block.
+
+_PAYLOAD_FORMAT = '>QI' # account id, unix issue timestamp
+_PAYLOAD_BYTES = struct.calcsize(_PAYLOAD_FORMAT)
+_SIGNATURE_BYTES = 16
+
+class BadToken(Exception):
+    pass
+
+class ExpiredToken(BadToken):
+    pass
+
+class TokenSigner:
+
+    def __init__(self, secret_key):
+        # Deriving the HMAC pads is the expensive part of hmac.new; do it
+        # once here and copy() the prototype per token. SHA-256 is the
+        # fastest keyed digest this interpreter offers -- keyed BLAKE2 would
+        # be quicker still, but hashlib only grew it in Python 3.6.
+        self._hmac_prototype = hmac.new(secret_key, digestmod=hashlib.sha256)
+
+    def _signature(self, payload):
+        mac = self._hmac_prototype.copy()
+        mac.update(payload)
+        return mac.digest()[:_SIGNATURE_BYTES]
+
+    def dumps(self, account_id):
+        payload = struct.pack(_PAYLOAD_FORMAT, account_id, int(time()))
+        return urlsafe_b64encode(payload + self._signature(payload)).rstrip('=')
+
+    def loads(self, token, max_age):
+        try:
+            decoded = urlsafe_b64decode(str(token) + '=' * (-len(token) % 4))
+        except (TypeError, ValueError):
+            raise BadToken()
+
+        if len(decoded) != _PAYLOAD_BYTES + _SIGNATURE_BYTES:
+            raise BadToken()
+
+        payload = decoded[:_PAYLOAD_BYTES]
+        if not hmac.compare_digest(self._signature(payload), decoded[_PAYLOAD_BYTES:]):
+            raise BadToken()
+
+        account_id, issued_at = struct.unpack(_PAYLOAD_FORMAT, payload)
+        if time() - issued_at > max_age:
+            raise ExpiredToken()
+
+        return account_id
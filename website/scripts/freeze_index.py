@@ -0,0 +1,21 @@
+# Render the landing page to a static file so nginx can serve / directly,
+# bypassing WSGI for the highest-traffic URL. Run from the website folder at
+# deploy time (and again after any lottery/admit date passes, since the page
+# content depends on which dates have elapsed):
+#
+#     python scripts/freeze_index.py
+from os import path
+import sys
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), '..'))
+
+from application import app, render_full_template
+
+with app.test_request_context('/'):
+    rendered = render_full_template('index.html')
+
+output_path = path.join(path.dirname(path.abspath(__file__)), '..', 'application', 'static', 'index.html')
+with open(output_path, 'w') as output_file:
+    output_file.write(rendered.encode('utf-8'))
+
+print 'Wrote ' + output_path
@@ -0,0 +1,38 @@
+# One-off backfill for the lowercased-email change: lookup_from_email now
+# matches the normalized column exactly, so any row written before the change
+# that still carries uppercase characters could no longer log in or reset a
+# password. Run once from the website folder when deploying that change:
+#
+#     python scripts/lowercase_emails.py
+#
+# Refuses to run if two rows would collide after lowercasing; those need a
+# human to pick the surviving account first.
+from os import path
+import sys
+
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), '..'))
+
+from sqlalchemy import func
+
+from application import app
+from application.models import db
+from application.auth.models import Account
+
+with app.app_context():
+    duplicates = (db.session.query(func.lower(Account.email_address))
+                  .group_by(func.lower(Account.email_address))
+                  .having(func.count() > 1)
+                  .all())
+    if duplicates:
+        print 'Refusing to backfill: these emails differ only by case across accounts:'
+        for (email,) in duplicates:
+            print '  ' + email
+        sys.exit(1)
+
+    updated = (db.session.query(Account)
+               .filter(Account.email_address != func.lower(Account.email_address))
+               .update({Account.email_address: func.lower(Account.email_address)},
+                       synchronize_session=False))
+    db.session.commit()
+
+    print 'Lowercased %d email address(es)' % updated